@@ -1,7 +1,18 @@
 import logging
 import ssl
 from base64 import b64encode
-from typing import Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+from typing import (
+    AbstractSet,
+    Dict,
+    Iterable,
+    List,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+    cast,
+)
 
 from .._backends.base import SOCKET_OPTION, NetworkBackend
 from .._exceptions import ProxyError
@@ -28,31 +39,84 @@ HeadersAsMapping = Mapping[Union[bytes, str], Union[bytes, str]]
 
 logger = logging.getLogger("httpcore.proxy")
 
+# Building the default SSL context loads the CA bundle from disk, so tunnels
+# share a single default context for each ALPN configuration.
+_default_tunnel_ssl_contexts: Dict[bool, ssl.SSLContext] = {}
+
 
 def merge_headers(
     default_headers: Optional[Sequence[Tuple[bytes, bytes]]] = None,
     override_headers: Optional[Sequence[Tuple[bytes, bytes]]] = None,
+    override_keys: Optional[AbstractSet[bytes]] = None,
+    default_keys: Optional[AbstractSet[bytes]] = None,
 ) -> List[Tuple[bytes, bytes]]:
     """
     Append default_headers and override_headers, de-duplicating if a key exists
     in both cases.
+
+    If the lowercased keys of either override_headers or default_headers are
+    already known, they may be passed as override_keys or default_keys, so that
+    they are not recomputed on each call.
     """
-    default_headers = [] if default_headers is None else list(default_headers)
-    override_headers = [] if override_headers is None else list(override_headers)
-    has_override = set(key.lower() for key, value in override_headers)
-    default_headers = [
+    if not override_headers:
+        return [] if default_headers is None else list(default_headers)
+    if not default_headers:
+        return list(override_headers)
+
+    if default_keys is not None and default_keys.isdisjoint(
+        key.lower() for key, value in override_headers
+    ):
+        # Nothing is overridden, so there's no need to filter the defaults.
+        headers = list(default_headers)
+        headers.extend(override_headers)
+        return headers
+
+    if override_keys is None:
+        override_keys = {key.lower() for key, value in override_headers}
+    headers = [
         (key, value)
         for key, value in default_headers
-        if key.lower() not in has_override
+        if key.lower() not in override_keys
     ]
-    return default_headers + override_headers
+    headers.extend(override_headers)
+    return headers
 
 
 def build_auth_header(username: bytes, password: bytes) -> bytes:
-    userpass = username + b":" + password
+    userpass = b"%b:%b" % (username, password)
     return b"Basic " + b64encode(userpass)
 
 
+def _default_tunnel_ssl_context(http2: bool) -> ssl.SSLContext:
+    """
+    Return the shared default SSL context for proxy tunnels, with the ALPN
+    protocols for the given HTTP/2 setting.
+    """
+    ssl_context = _default_tunnel_ssl_contexts.get(http2)
+    if ssl_context is None:
+        ssl_context = default_ssl_context()
+        alpn_protocols = ["http/1.1", "h2"] if http2 else ["http/1.1"]
+        ssl_context.set_alpn_protocols(alpn_protocols)
+        _default_tunnel_ssl_contexts[http2] = ssl_context
+    return ssl_context
+
+
+def _proxy_headers_and_keys(
+    proxy_headers: Union[HeadersAsMapping, HeadersAsSequence, None],
+    proxy_headers_lower: Optional[AbstractSet[bytes]],
+) -> Tuple[Sequence[Tuple[bytes, bytes]], AbstractSet[bytes]]:
+    """
+    Return the validated proxy headers, together with their lowercased keys.
+
+    If the lowercased keys are passed in, then the headers have already been
+    validated by the proxy pool, and are used as-is rather than being copied.
+    """
+    if proxy_headers_lower is not None:
+        return cast(Sequence[Tuple[bytes, bytes]], proxy_headers), proxy_headers_lower
+    headers = enforce_headers(proxy_headers, name="proxy_headers")
+    return headers, frozenset(key.lower() for key, value in headers)
+
+
 class HTTPProxy(ConnectionPool):
     """
     A connection pool that sends requests via an HTTP proxy.
@@ -135,20 +199,27 @@ class HTTPProxy(ConnectionPool):
 
         self._ssl_context = ssl_context
         self._proxy_ssl_context = proxy_ssl_context
-        self._proxy_headers = enforce_headers(proxy_headers, name="proxy_headers")
+        proxy_headers = enforce_headers(proxy_headers, name="proxy_headers")
         if proxy_auth is not None:
             username = enforce_bytes(proxy_auth[0], name="proxy_auth")
             password = enforce_bytes(proxy_auth[1], name="proxy_auth")
             authorization = build_auth_header(username, password)
-            self._proxy_headers = [
-                (b"Proxy-Authorization", authorization)
-            ] + self._proxy_headers
+            proxy_headers = [(b"Proxy-Authorization", authorization)] + proxy_headers
+
+        # The proxy headers are fixed for the lifetime of the pool, so they're
+        # stored as an immutable tuple which is shared by every connection,
+        # along with their lowercased keys.
+        self._proxy_headers: Tuple[Tuple[bytes, bytes], ...] = tuple(proxy_headers)
+        self._proxy_headers_lower = frozenset(
+            key.lower() for key, value in self._proxy_headers
+        )
 
     def create_connection(self, origin: Origin) -> ConnectionInterface:
         if origin.scheme == b"http":
             return ForwardHTTPConnection(
                 proxy_origin=self._proxy_url.origin,
                 proxy_headers=self._proxy_headers,
+                proxy_headers_lower=self._proxy_headers_lower,
                 remote_origin=origin,
                 keepalive_expiry=self._keepalive_expiry,
                 network_backend=self._network_backend,
@@ -157,6 +228,7 @@ class HTTPProxy(ConnectionPool):
         return TunnelHTTPConnection(
             proxy_origin=self._proxy_url.origin,
             proxy_headers=self._proxy_headers,
+            proxy_headers_lower=self._proxy_headers_lower,
             remote_origin=origin,
             ssl_context=self._ssl_context,
             proxy_ssl_context=self._proxy_ssl_context,
@@ -168,6 +240,17 @@ class HTTPProxy(ConnectionPool):
 
 
 class ForwardHTTPConnection(ConnectionInterface):
+    __slots__ = (
+        "_connection",
+        "_proxy_origin",
+        "_proxy_scheme",
+        "_proxy_host",
+        "_proxy_port",
+        "_proxy_headers",
+        "_proxy_headers_lower",
+        "_remote_origin",
+    )
+
     def __init__(
         self,
         proxy_origin: Origin,
@@ -177,6 +260,7 @@ class ForwardHTTPConnection(ConnectionInterface):
         network_backend: Optional[NetworkBackend] = None,
         socket_options: Optional[Iterable[SOCKET_OPTION]] = None,
         proxy_ssl_context: Optional[ssl.SSLContext] = None,
+        proxy_headers_lower: Optional[AbstractSet[bytes]] = None,
     ) -> None:
         self._connection = HTTPConnection(
             origin=proxy_origin,
@@ -186,15 +270,27 @@ class ForwardHTTPConnection(ConnectionInterface):
             ssl_context=proxy_ssl_context,
         )
         self._proxy_origin = proxy_origin
-        self._proxy_headers = enforce_headers(proxy_headers, name="proxy_headers")
+        self._proxy_scheme = proxy_origin.scheme
+        self._proxy_host = proxy_origin.host
+        self._proxy_port = proxy_origin.port
+        self._proxy_headers, self._proxy_headers_lower = _proxy_headers_and_keys(
+            proxy_headers, proxy_headers_lower
+        )
         self._remote_origin = remote_origin
 
     def handle_request(self, request: Request) -> Response:
-        headers = merge_headers(self._proxy_headers, request.headers)
+        headers = merge_headers(
+            self._proxy_headers,
+            request.headers,
+            default_keys=self._proxy_headers_lower,
+        )
+        # The absolute-form target is serialized afresh on each call, rather than
+        # being cached on the request. The extensions dict belongs to the caller
+        # and may be shared between requests, and the URL itself is mutable.
         url = URL(
-            scheme=self._proxy_origin.scheme,
-            host=self._proxy_origin.host,
-            port=self._proxy_origin.port,
+            scheme=self._proxy_scheme,
+            host=self._proxy_host,
+            port=self._proxy_port,
             target=bytes(request.url),
         )
         proxy_request = Request(
@@ -232,6 +328,26 @@ class ForwardHTTPConnection(ConnectionInterface):
 
 
 class TunnelHTTPConnection(ConnectionInterface):
+    __slots__ = (
+        "_connection",
+        "_proxy_origin",
+        "_proxy_scheme",
+        "_proxy_host",
+        "_proxy_port",
+        "_remote_origin",
+        "_ssl_context",
+        "_proxy_ssl_context",
+        "_proxy_headers",
+        "_proxy_headers_lower",
+        "_keepalive_expiry",
+        "_http1",
+        "_http2",
+        "_connect_lock",
+        "_connected",
+        "_connect_target",
+        "_connect_headers",
+    )
+
     def __init__(
         self,
         proxy_origin: Origin,
@@ -244,6 +360,7 @@ class TunnelHTTPConnection(ConnectionInterface):
         http2: bool = False,
         network_backend: Optional[NetworkBackend] = None,
         socket_options: Optional[Iterable[SOCKET_OPTION]] = None,
+        proxy_headers_lower: Optional[AbstractSet[bytes]] = None,
     ) -> None:
         self._connection: ConnectionInterface = HTTPConnection(
             origin=proxy_origin,
@@ -253,96 +370,104 @@ class TunnelHTTPConnection(ConnectionInterface):
             ssl_context=proxy_ssl_context,
         )
         self._proxy_origin = proxy_origin
+        self._proxy_scheme = proxy_origin.scheme
+        self._proxy_host = proxy_origin.host
+        self._proxy_port = proxy_origin.port
         self._remote_origin = remote_origin
         self._ssl_context = ssl_context
         self._proxy_ssl_context = proxy_ssl_context
-        self._proxy_headers = enforce_headers(proxy_headers, name="proxy_headers")
+        self._proxy_headers, self._proxy_headers_lower = _proxy_headers_and_keys(
+            proxy_headers, proxy_headers_lower
+        )
         self._keepalive_expiry = keepalive_expiry
         self._http1 = http1
         self._http2 = http2
         self._connect_lock = Lock()
         self._connected = False
+        self._connect_target = b"%b:%d" % (remote_origin.host, remote_origin.port)
+        self._connect_headers = merge_headers(
+            [(b"Host", self._connect_target), (b"Accept", b"*/*")],
+            self._proxy_headers,
+            override_keys=self._proxy_headers_lower,
+        )
 
     def handle_request(self, request: Request) -> Response:
-        timeouts = request.extensions.get("timeout", {})
-        timeout = timeouts.get("connect", None)
-
-        with self._connect_lock:
-            if not self._connected:
-                target = b"%b:%d" % (self._remote_origin.host, self._remote_origin.port)
-
-                connect_url = URL(
-                    scheme=self._proxy_origin.scheme,
-                    host=self._proxy_origin.host,
-                    port=self._proxy_origin.port,
-                    target=target,
-                )
-                connect_headers = merge_headers(
-                    [(b"Host", target), (b"Accept", b"*/*")], self._proxy_headers
-                )
-                connect_request = Request(
-                    method=b"CONNECT",
-                    url=connect_url,
-                    headers=connect_headers,
-                    extensions=request.extensions,
-                )
-                connect_response = self._connection.handle_request(
-                    connect_request
-                )
-
-                if connect_response.status < 200 or connect_response.status > 299:
-                    reason_bytes = connect_response.extensions.get("reason_phrase", b"")
-                    reason_str = reason_bytes.decode("ascii", errors="ignore")
-                    msg = "%d %s" % (connect_response.status, reason_str)
-                    self._connection.close()
-                    raise ProxyError(msg)
-
-                stream = connect_response.extensions["network_stream"]
-
-                # Upgrade the stream to SSL
-                ssl_context = (
-                    default_ssl_context()
-                    if self._ssl_context is None
-                    else self._ssl_context
-                )
-                alpn_protocols = ["http/1.1", "h2"] if self._http2 else ["http/1.1"]
-                ssl_context.set_alpn_protocols(alpn_protocols)
-
-                kwargs = {
-                    "ssl_context": ssl_context,
-                    "server_hostname": self._remote_origin.host.decode("ascii"),
-                    "timeout": timeout,
-                }
-                with Trace("start_tls", logger, request, kwargs) as trace:
-                    stream = stream.start_tls(**kwargs)
-                    trace.return_value = stream
-
-                # Determine if we should be using HTTP/1.1 or HTTP/2
-                ssl_object = stream.get_extra_info("ssl_object")
-                http2_negotiated = (
-                    ssl_object is not None
-                    and ssl_object.selected_alpn_protocol() == "h2"
-                )
-
-                # Create the HTTP/1.1 or HTTP/2 connection
-                if http2_negotiated or (self._http2 and not self._http1):
-                    from .http2 import HTTP2Connection
-
-                    self._connection = HTTP2Connection(
-                        origin=self._remote_origin,
-                        stream=stream,
-                        keepalive_expiry=self._keepalive_expiry,
-                    )
-                else:
-                    self._connection = HTTP11Connection(
-                        origin=self._remote_origin,
-                        stream=stream,
-                        keepalive_expiry=self._keepalive_expiry,
-                    )
-
-                self._connected = True
+        # Once the tunnel is established we don't need to take the lock, since
+        # `_connected` is only set after `_connection` has been replaced.
+        if not self._connected:
+            with self._connect_lock:
+                if not self._connected:
+                    self._connect(request)
         return self._connection.handle_request(request)
 
+    def _connect(self, request: Request) -> None:
+        timeouts = request.extensions.get("timeout")
+        timeout = None if timeouts is None else timeouts.get("connect")
+
+        connect_url = URL(
+            scheme=self._proxy_scheme,
+            host=self._proxy_host,
+            port=self._proxy_port,
+            target=self._connect_target,
+        )
+        connect_request = Request(
+            method=b"CONNECT",
+            url=connect_url,
+            headers=self._connect_headers,
+            extensions=request.extensions,
+        )
+        connect_response = self._connection.handle_request(connect_request)
+
+        if connect_response.status < 200 or connect_response.status > 299:
+            reason_bytes = connect_response.extensions.get("reason_phrase", b"")
+            reason_str = reason_bytes.decode("ascii", errors="ignore")
+            msg = "%d %s" % (connect_response.status, reason_str)
+            self._connection.close()
+            raise ProxyError(msg)
+
+        stream = connect_response.extensions["network_stream"]
+
+        # Upgrade the stream to SSL
+        if self._ssl_context is None:
+            ssl_context = _default_tunnel_ssl_context(self._http2)
+        else:
+            ssl_context = self._ssl_context
+            alpn_protocols = ["http/1.1", "h2"] if self._http2 else ["http/1.1"]
+            ssl_context.set_alpn_protocols(alpn_protocols)
+
+        kwargs = {
+            "ssl_context": ssl_context,
+            "server_hostname": self._remote_origin.host.decode("ascii"),
+            "timeout": timeout,
+        }
+        with Trace("start_tls", logger, request, kwargs) as trace:
+            stream = stream.start_tls(**kwargs)
+            trace.return_value = stream
+
+        # Determine if we should be using HTTP/1.1 or HTTP/2
+        ssl_object = stream.get_extra_info("ssl_object")
+        http2_negotiated = (
+            ssl_object is not None and ssl_object.selected_alpn_protocol() == "h2"
+        )
+
+        # Create the HTTP/1.1 or HTTP/2 connection
+        if http2_negotiated or (self._http2 and not self._http1):
+            from .http2 import HTTP2Connection
+
+            self._connection = HTTP2Connection(
+                origin=self._remote_origin,
+                stream=stream,
+                keepalive_expiry=self._keepalive_expiry,
+            )
+        else:
+            self._connection = HTTP11Connection(
+                origin=self._remote_origin,
+                stream=stream,
+                keepalive_expiry=self._keepalive_expiry,
+            )
+
+        self._connected = True
+
     def can_handle_request(self, origin: Origin) -> bool:
         return origin == self._remote_origin
 
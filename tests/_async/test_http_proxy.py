@@ -69,6 +69,65 @@ async def test_proxy_forwarding():
         )
 
 
+@pytest.mark.anyio
+async def test_proxy_forwarding_with_headers():
+    """
+    Send HTTP requests via a proxy, with proxy headers that may be overridden
+    by the request headers.
+    """
+    network_backend = AsyncMockBackend(
+        [
+            b"HTTP/1.1 200 OK\r\n",
+            b"Content-Type: plain/text\r\n",
+            b"Content-Length: 13\r\n",
+            b"\r\n",
+            b"Hello, world!",
+            b"HTTP/1.1 200 OK\r\n",
+            b"Content-Type: plain/text\r\n",
+            b"Content-Length: 13\r\n",
+            b"\r\n",
+            b"Hello, world!",
+        ]
+    )
+    sent_headers = []
+
+    async def trace(name, kwargs):
+        if name == "http11.send_request_headers.started":
+            sent_headers.append(kwargs["request"].headers)
+
+    async with AsyncHTTPProxy(
+        proxy_url="http://localhost:8080/",
+        proxy_headers={"Proxy-Authorization": "abc", "X-Proxy": "1"},
+        network_backend=network_backend,
+    ) as proxy:
+        await proxy.request(
+            "GET",
+            "http://example.com/",
+            headers={"Accept": "*/*"},
+            extensions={"trace": trace},
+        )
+        await proxy.request(
+            "GET",
+            "http://example.com/",
+            headers={"x-proxy": "2"},
+            extensions={"trace": trace},
+        )
+
+    assert sent_headers == [
+        [
+            (b"Proxy-Authorization", b"abc"),
+            (b"X-Proxy", b"1"),
+            (b"Host", b"example.com"),
+            (b"Accept", b"*/*"),
+        ],
+        [
+            (b"Proxy-Authorization", b"abc"),
+            (b"Host", b"example.com"),
+            (b"x-proxy", b"2"),
+        ],
+    ]
+
+
 @pytest.mark.anyio
 async def test_proxy_tunneling():
     """
@@ -266,6 +325,6 @@ async def test_proxy_tunneling_with_auth():
 
         # Dig into this private property as a cheap lazy way of
         # checking that the proxy header is set correctly.
-        assert proxy._proxy_headers == [  # type: ignore
-            (b"Proxy-Authorization", b"Basic dXNlcm5hbWU6cGFzc3dvcmQ=")
-        ]
+        assert proxy._proxy_headers == (  # type: ignore
+            (b"Proxy-Authorization", b"Basic dXNlcm5hbWU6cGFzc3dvcmQ="),
+        )
@@ -0,0 +1,38 @@
+import inspect
+import typing
+
+import pytest
+
+from httpcore._async import http_proxy as async_http_proxy
+from httpcore._sync import http_proxy as sync_http_proxy
+
+
+def parameters(func: typing.Callable[..., typing.Any]) -> typing.List[typing.Any]:
+    return [
+        (param.name, param.kind, param.default)
+        for param in inspect.signature(func).parameters.values()
+    ]
+
+
+@pytest.mark.parametrize(
+    "name", ["HTTPProxy", "ForwardHTTPConnection", "TunnelHTTPConnection"]
+)
+def test_sync_and_async_proxy_classes_match(name):
+    """
+    The sync proxy classes are generated from the async ones by `unasync.py`,
+    and should expose the same constructor, request handling and slots.
+    """
+    async_cls = getattr(async_http_proxy, f"Async{name}")
+    sync_cls = getattr(sync_http_proxy, name)
+
+    assert parameters(async_cls.__init__) == parameters(sync_cls.__init__)
+    assert parameters(async_cls.handle_async_request) == parameters(
+        sync_cls.handle_request
+    )
+    assert getattr(async_cls, "__slots__", None) == getattr(sync_cls, "__slots__", None)
+
+
+def test_sync_and_async_merge_headers_match():
+    assert parameters(async_http_proxy.merge_headers) == parameters(
+        sync_http_proxy.merge_headers
+    )